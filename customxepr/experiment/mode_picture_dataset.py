@@ -8,11 +8,18 @@ Attribution-NonCommercial-NoDerivs 2.0 UK: England & Wales License.
 """
 import re
 import math
+import numbers
 import numpy as np
 import time
+import copy
+import threading
+from collections import OrderedDict
 
-from lmfit import Model
-from lmfit.models import PolynomialModel
+_models = {}  # composite lmfit models by degree of the polynomial background
+
+_FIT_CACHE_SIZE = 32
+_fit_cache = OrderedDict()  # maps (x_data, y_data, degree) to lmfit results
+_fit_cache_lock = threading.Lock()
 
 
 def lorentz_peak(x, x0, w, a):
@@ -21,10 +28,38 @@ def lorentz_peak(x, x0, w, a):
     """
 
     numerator = 2 / math.pi * w
-    denominator = 4 * (x - x0) ** 2 + w ** 2
+    # build the denominator in place to avoid allocating intermediate arrays
+    denominator = np.subtract(x, x0, dtype=np.float64)
+    denominator *= denominator
+    denominator *= 4
+    denominator += w ** 2
     return a * numerator / denominator
 
 
+def _poly_basis(x, degree=7):
+    """
+    Returns the Vandermonde matrix of `x` with increasing powers up to `degree`, i.e.,
+    the basis of the polynomial background in the same order as its coefficients.
+    """
+    return np.vander(np.asarray(x, dtype=np.float64), degree + 1, increasing=True)
+
+
+def _mode_picture_model(degree=7):
+    """
+    Returns the lmfit model of a Lorentzian dip on a polynomial background of the
+    given degree. lmfit is only imported and the model only built on first use.
+    """
+    try:
+        return _models[degree]
+    except KeyError:
+        from lmfit import Model
+        from lmfit.models import PolynomialModel
+
+        model = PolynomialModel(degree=degree) - Model(lorentz_peak)
+        _models[degree] = model
+        return model
+
+
 class ModePicture:
     """
     Class to store mode pictures. It provides methods to calculate Q-values, and save
@@ -37,6 +72,8 @@ class ModePicture:
         picture data sets as values or path to file with saved mode picture data.
     :param float freq: Cavity resonance frequency in GHz as float.
     :param dict metadata: Optional dictionary with metadata to save in the file header.
+    :param int poly_degree: Degree of the polynomial background used when fitting
+        the resonance dip. Must be between 0 and 7. Defaults to 7.
 
     :ivar x_data_mhz: Numpy array with x-axis data of mode picture in MHz.
     :ivar x_data_points: Numpy array with x-axis data of mode picture in pts.
@@ -46,9 +83,17 @@ class ModePicture:
     :ivar qvalue_stderr: Standard error of Q-Value from fitting.
     """
 
-    def __init__(self, input_path_or_data, freq=9.385, metadata=None):
+    def __init__(self, input_path_or_data, freq=9.385, metadata=None, poly_degree=7):
+
+        if (
+            not isinstance(poly_degree, numbers.Integral)
+            or isinstance(poly_degree, bool)
+            or poly_degree not in range(8)
+        ):
+            raise ValueError("'poly_degree' must be an integer between 0 and 7.")
 
         self.metadata = metadata if metadata else {}
+        self.poly_degree = poly_degree
 
         if isinstance(input_path_or_data, str):
             self.load(input_path_or_data)
@@ -77,23 +122,6 @@ class ModePicture:
                 "picture data or a path to a mode picture file."
             )
 
-    @staticmethod
-    def _points_to_mhz(n_points, zf, x0):
-        """
-        Converts an x-axis from points to MHz according to the mode picture's zoom factor.
-
-        :param int n_points: Number of data points in mode picture.
-        :param int zf: Zoom factor, i.e., scaling factor of x-axis. Typically is 1, 2,
-            4, or 8.
-        :param int x0: Center of axis corresponding to `freq0`.
-        :returns: X-axis of mode picture in MHz.
-        :rtype: np.array
-        """
-        x_axis_points = np.arange(0, n_points)
-        x_axis_mhz = 1e-3 / (2 * zf) * (x_axis_points - x0)
-
-        return x_axis_mhz
-
     def combine_data(self, mode_pic_data):
         """
         Rescales mode pictures from different zoom factors and combines them to one.
@@ -108,24 +136,29 @@ class ModePicture:
         n_points = len(next(iter(mode_pic_data.values())))
         x_axis_points = np.arange(0, n_points)
 
-        x_axis_mhz = {}
+        x_axis_points_scaled = {}
+
+        # all zoom factors share the same x-axis and therefore the same basis
+        basis = _poly_basis(x_axis_points, self.poly_degree)
 
-        # rescale x-axes according to zoom factor
+        # rescale x-axes according to zoom factor, centered at the cavity resonance
         for zf in mode_pic_data.keys():
-            q_value, fit_rslt = self.fit_qvalue(x_axis_points, mode_pic_data[zf], zf)
-            x_axis_mhz[zf] = self._points_to_mhz(
-                n_points, zf, fit_rslt.best_values["x0"]
+            q_value, fit_rslt = self.fit_qvalue(
+                x_axis_points, mode_pic_data[zf], zf, basis=basis
             )
+            x0 = fit_rslt.best_values["x0"]
+            x_axis_points_scaled[zf] = (x_axis_points - x0) / zf
 
         # combine data from all zoom factors
-        x_axis_mhz_comb = np.concatenate(list(x_axis_mhz.values()))
+        x_axis_points_comb = np.concatenate(list(x_axis_points_scaled.values()))
         mode_pic_comb = np.concatenate(list(mode_pic_data.values()))
 
-        # sort arrays in order of ascending frequency
-        indices = np.argsort(x_axis_mhz_comb)
-        x_axis_mhz_comb = x_axis_mhz_comb[indices]
+        # sort arrays in order of ascending frequency, each zoom factor contributes
+        # an already sorted run which the stable sort (timsort) merges in linear time
+        indices = np.argsort(x_axis_points_comb, kind="stable")
+        x_axis_points_comb = x_axis_points_comb[indices]
         mode_pic_comb = mode_pic_comb[indices]
-        x_axis_points_comb = 2 / 1e-3 * x_axis_mhz_comb
+        x_axis_mhz_comb = 1e-3 / 2 * x_axis_points_comb
 
         return x_axis_mhz_comb, x_axis_points_comb, mode_pic_comb
 
@@ -134,61 +167,133 @@ class ModePicture:
         """
         Returns plausible starting points for least square Lorentzian fit.
         """
+        x_data = np.asarray(x_data)
+        y_data = np.asarray(y_data)
+
         # find center dip
-        peak_center = x_data[np.argmin(y_data)]
+        i_min = np.argmin(y_data)
+        y_min = y_data[i_min]
+        peak_center = x_data[i_min]
 
         # find baseline height
         interval = 0.25
         n_points = len(x_data)
         bs1 = np.mean(y_data[0 : int(n_points * interval)])
         bs2 = np.mean(y_data[-int(n_points * interval) : -1])
-        baseline = np.mean([bs1, bs2])
-
-        # find peak area
-        peak_height = baseline - np.min(y_data)
-        peak_index = y_data < peak_height / 2 + np.min(y_data)
-        fwhm = max(np.max(x_data[peak_index]) - np.min(x_data[peak_index]), 1)
+        baseline = (bs1 + bs2) / 2
+
+        # find peak area, x_data is sorted so the outermost points below half
+        # maximum give the width
+        peak_height = baseline - y_min
+        peak_idx = np.flatnonzero(y_data < peak_height / 2 + y_min)
+        if peak_idx.size > 0:
+            fwhm = max(x_data[peak_idx[-1]] - x_data[peak_idx[0]], 1)
+        else:
+            fwhm = 1
         peak_area = peak_height * fwhm * math.pi / 2
 
         return peak_center, fwhm, peak_area
 
-    def fit_qvalue(self, x_data, y_data, zoom_factor=1):
+    @classmethod
+    def _fit_mode_picture(cls, x_data, y_data, degree, basis=None):
+        """
+        Performs the least square fit of Lorentzian and polynomial background.
+        """
+        # get first guess parameters for Lorentzian fit
+        peak_center, fwhm, peak_area = cls._get_fit_starting_points(x_data, y_data)
+
+        # isolate back ground area from resonance dip, x_data is sorted in
+        # ascending order so that the window edges can be found by bisection
+        idx1 = np.searchsorted(x_data, peak_center - 3 * fwhm, side="left")
+        idx2 = np.searchsorted(x_data, peak_center + 3 * fwhm, side="right")
+
+        bg_indices = np.r_[0:idx1, idx2 : len(x_data)]
+        y_bg = np.asarray(y_data)[bg_indices]
+
+        # get first guess parameters for background from a linear least squares fit,
+        # scaling the columns of the basis to keep the problem well conditioned
+        if basis is None:
+            basis = _poly_basis(x_data, degree)
+
+        basis_bg = basis[bg_indices]
+        scale = np.sqrt((basis_bg * basis_bg).sum(axis=0))
+        scale[scale == 0] = 1
+        coeffs = np.linalg.lstsq(basis_bg / scale, y_bg, rcond=None)[0] / scale
+
+        # set up fit parameters for polynomial background and Lorentzian dip
+        mode_picture_model = _mode_picture_model(degree)
+        pars = mode_picture_model.make_params(
+            x0=peak_center,
+            w=fwhm,
+            a=peak_area,
+            **{f"c{i}": c for i, c in enumerate(coeffs)},
+        )
+
+        # derivatives of the residual `data - model` by the background coefficients
+        d_coeffs = -basis.T
+
+        def jacobian(params, *args, **kwargs):
+            """
+            Analytic Jacobian of the residual `data - model` with respect to the fit
+            parameters, one row per parameter. Saves the finite difference evaluations
+            of the model in every iteration.
+            """
+            x0, w, a = params["x0"].value, params["w"].value, params["a"].value
+
+            diff = x_data - x0
+            den = 4 * diff * diff + w ** 2
+            den_sq = den * den
+
+            # the Lorentzian is subtracted from the background and therefore enters
+            # the residual with a positive sign
+            d_x0 = a * 2 / math.pi * w * 8 * diff / den_sq
+            d_w = a * 2 / math.pi * (den - 2 * w ** 2) / den_sq
+            d_a = 2 / math.pi * w / den
+
+            return np.vstack((d_coeffs, d_x0, d_w, d_a))
+
+        # perform full fit
+        return mode_picture_model.fit(
+            y_data,
+            pars,
+            x=x_data,
+            fit_kws={"Dfun": jacobian, "col_deriv": True},
+        )
+
+    def fit_qvalue(self, x_data, y_data, zoom_factor=1, basis=None):
         """
         Least square fit of Lorentzian and polynomial background to mode picture.
+        Results are cached so that identical data is only fitted once.
 
         :param x_data: Iterable containing x-data of mode picture in points.
         :param y_data: Iterable containing y-data of mode picture in a.u..
         :param zoom_factor: Zoom factor (scaling factor of x-axis).
+        :param basis: Optional precomputed polynomial basis of `x_data`, as returned
+            by :func:`_poly_basis`. Will be computed if not given.
         :returns: (q_value, fit_result) where `fit_result` is a
         """
-        # get first guess parameters for Lorentzian fit
-        peak_center, fwhm, peak_area = self._get_fit_starting_points(x_data, y_data)
-
-        # set up fit models for polynomial background and Lorentzian dip
-        pmod = PolynomialModel(degree=7)
-        lmodel = Model(lorentz_peak)
+        x_data = np.asarray(x_data, dtype=np.float64)
+        y_data = np.asarray(y_data, dtype=np.float64)
 
-        mode_picture_model = pmod - lmodel
+        key = (x_data.tobytes(), y_data.tobytes(), self.poly_degree)
 
-        # isolate back ground area from resonance dip
-        idx1 = sum((x_data < (peak_center - 3 * fwhm)))
-        idx2 = sum((x_data > (peak_center + 3 * fwhm)))
+        # move cache hits to the end, the least recently used fit is evicted first
+        with _fit_cache_lock:
+            cached_result = _fit_cache.pop(key, None)
+            if cached_result is not None:
+                _fit_cache[key] = cached_result
 
-        x_bg = np.concatenate((x_data[0:idx1], x_data[-idx2:-1]))
-        y_bg = np.concatenate((y_data[0:idx1], y_data[-idx2:-1]))
-
-        # get first guess parameters for background
-        pars = pmod.guess(y_bg, x=x_bg)
-
-        # add fit parameters for Lorentzian resonance dip
-        pars.add_many(
-            ("x0", peak_center, True, None, None, None, None),
-            ("w", fwhm, True, None, None, None, None),
-            ("a", peak_area, True, None, None, None, None),
-        )
+        if cached_result is None:
+            cached_result = self._fit_mode_picture(
+                x_data, y_data, self.poly_degree, basis
+            )
+            with _fit_cache_lock:
+                _fit_cache[key] = cached_result
+                if len(_fit_cache) > _FIT_CACHE_SIZE:
+                    _fit_cache.popitem(last=False)
 
-        # perform full fit
-        fit_result = mode_picture_model.fit(y_data, pars, x=x_data)
+        # hand out a copy so that changes to one fit result do not affect others
+        fit_result = copy.deepcopy(cached_result)
 
         # calculate Q-value from resonance width
         delta_freq = fit_result.best_values["w"] * 1e-3 / (2 * zoom_factor)
@@ -258,10 +363,10 @@ class ModePicture:
 
         header = "\n".join(metadata + [column_titles])
 
-        data_matrix = np.concatenate(([self.x_data_mhz], [self.y_data]), axis=0)
+        data_matrix = np.column_stack((self.x_data_mhz, self.y_data))
 
         # noinspection PyTypeChecker
-        np.savetxt(filepath, data_matrix.T, fmt="%.9E", delimiter="\t", header=header)
+        np.savetxt(filepath, data_matrix, fmt="%.9E", delimiter="\t", header=header)
 
     def load(self, path):
         """
@@ -270,15 +375,15 @@ class ModePicture:
         :param str path: Path of file.
         """
 
-        data_matrix = np.loadtxt(path)
+        with open(path, "r") as f:
+            lines = f.readlines()
+
+        data_matrix = np.loadtxt(lines)
 
         self.x_data_mhz = data_matrix[:, 0]
         self.y_data = data_matrix[:, 1]
         self.x_data_points = 2 / 1e-3 * self.x_data_mhz
 
-        with open(path, "r") as f:
-            lines = f.readlines()
-
         header_length = sum(line.startswith("#") for line in lines)
         metadata_length = header_length - 1  # last line of header are column titles
 
@@ -289,10 +394,8 @@ class ModePicture:
             if match:
                 self.metadata[match["key"]] = match["value"]
 
-        freq_data = filter(lambda x: x in "0123456789.", self.metadata["Frequency"])
-        freq_str = "".join(freq_data)
-
-        self.freq0 = float(freq_str)
+        match = re.search(r"\d*\.?\d+", self.metadata["Frequency"])
+        self.freq0 = float(match.group())
 
         self.qvalue, self.fit_result = self.fit_qvalue(self.x_data_points, self.y_data)
         self.qvalue_stderr = self.get_qvalue_stderr()
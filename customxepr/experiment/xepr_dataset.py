@@ -788,9 +788,14 @@ class ParamDict(MutableMapping):
 
     def __getitem__(self, key: str) -> XeprParam:
 
-        flat_dict = self._flatten()
+        # look up the key group by group instead of flattening all parameters, later
+        # groups take precedence as in :meth:`_flatten`
+        for layer in reversed(list(self.layers.values())):
+            for group in reversed(list(layer.groups.values())):
+                if key in group.pars:
+                    return group.pars[key]
 
-        return flat_dict[key]
+        raise KeyError(key)
 
     def __setitem__(self, key: str, value: Union[XeprParam, ParamValueType]) -> None:
 
@@ -1152,37 +1157,40 @@ class XeprData:
 
         self._dta = np.fromfile(dta_path, fmt)
 
-        if self.pars["XTYP"].value == "IDX":  # indexed data
-            ax_min = self.pars["XMIN"].value
-            ax_max = ax_min + self.pars["XWID"].value
-            ax_pts = self.pars["XPTS"].value
+        # parameters are not modified while loading, flatten them only once
+        pars = self.pars._flatten()
+
+        if pars["XTYP"].value == "IDX":  # indexed data
+            ax_min = pars["XMIN"].value
+            ax_max = ax_min + pars["XWID"].value
+            ax_pts = pars["XPTS"].value
             self._x = np.linspace(ax_min, ax_max, ax_pts)
-        elif self.pars["XTYP"].value == "IGD":  # data points saved in file
+        elif pars["XTYP"].value == "IGD":  # data points saved in file
             fmt = self._get_axis_dtype("X")
             self._x = np.fromfile(base_path + ".XGF", fmt)
-        elif self.pars["XTYP"].value == "NTUP":  # currently not supported
+        elif pars["XTYP"].value == "NTUP":  # currently not supported
             raise IOError("Tuple data is currently not supported by XeprData.")
 
-        if self.pars["YTYP"].value == "IDX":  # indexed data
-            ax_min = self.pars["YMIN"].value
-            ax_max = ax_min + self.pars["YWID"].value
-            ax_pts = self.pars["YPTS"].value
+        if pars["YTYP"].value == "IDX":  # indexed data
+            ax_min = pars["YMIN"].value
+            ax_max = ax_min + pars["YWID"].value
+            ax_pts = pars["YPTS"].value
             self._y = np.linspace(ax_min, ax_max, ax_pts)
-        elif self.pars["YTYP"].value == "IGD":  # data points saved in file
+        elif pars["YTYP"].value == "IGD":  # data points saved in file
             fmt = self._get_axis_dtype("Y")
             self._y = np.fromfile(base_path + ".YGF", fmt)
-        elif self.pars["YTYP"].value == "NTUP":  # currently not supported
+        elif pars["YTYP"].value == "NTUP":  # currently not supported
             raise IOError("Tuple data is currently not supported by XeprData.")
 
-        if self.pars["ZTYP"].value == "IDX":  # indexed data
-            ax_min = self.pars["ZMIN"].value
-            ax_max = ax_min + self.pars["ZWID"].value
-            ax_pts = self.pars["ZPTS"].value
+        if pars["ZTYP"].value == "IDX":  # indexed data
+            ax_min = pars["ZMIN"].value
+            ax_max = ax_min + pars["ZWID"].value
+            ax_pts = pars["ZPTS"].value
             self._z = np.linspace(ax_min, ax_max, ax_pts)
-        elif self.pars["ZTYP"].value == "IGD":  # data points saved in file
+        elif pars["ZTYP"].value == "IGD":  # data points saved in file
             fmt = self._get_axis_dtype("Z")
             self._z = np.fromfile(base_path + ".ZGF", fmt)
-        elif self.pars["ZTYP"].value == "NTUP":  # currently not supported
+        elif pars["ZTYP"].value == "NTUP":  # currently not supported
             raise IOError("Tuple data is currently not supported by XeprData.")
 
         if self._z.size > 0:
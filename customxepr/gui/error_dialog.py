@@ -15,6 +15,8 @@ from traceback import format_exception
 
 from customxepr import __author__
 
+_shown_tracebacks = set()  # tracebacks currently displayed by dialog_except_hook
+
 
 class ErrorDialog(QtWidgets.QDialog):
     def __init__(self, title, message, error_info, parent=None):
@@ -55,22 +57,33 @@ class ErrorDialog(QtWidgets.QDialog):
 def dialog_except_hook(etype, evalue, tb):
     """
     Custom exception hook which displays exceptions from threads in a QMessageBox.
+    Identical exceptions raised while their dialog is still open are not shown again,
+    preventing a storm of repeated errors from stacking up modal dialogs.
     """
+    error_info = (etype, evalue, tb)
+    tb_string = "".join(format_exception(*error_info))
+
+    if tb_string in _shown_tracebacks:
+        return
+
     title = "CustomXepr Internal Error"
     message = (
         "CustomXepr has encountered an internal error. "
         + "Please report this bug to %s." % __author__
     )
-    error_info = (etype, evalue, tb)
-    msg_box = ErrorDialog(title, message, error_info)
-    msg_box.exec_()
+
+    _shown_tracebacks.add(tb_string)
+    try:
+        msg_box = ErrorDialog(title, message, error_info)
+        msg_box.exec_()
+    finally:
+        _shown_tracebacks.discard(tb_string)
 
 
 def patch_excepthook(new_except_hook=dialog_except_hook):
     """
     Replaces old exception hook with new hook :param:`new_except_hook` in Qt event loop.
     """
-    global TIMER
 
     def _patch_excepthook():
         """
@@ -78,7 +91,5 @@ def patch_excepthook(new_except_hook=dialog_except_hook):
         """
         sys.excepthook = new_except_hook
 
-    TIMER = QtCore.QTimer()
-    TIMER.setSingleShot(True)
-    TIMER.timeout.connect(_patch_excepthook)
-    TIMER.start()
+    # Qt keeps a reference to the callback until the timer has fired
+    QtCore.QTimer.singleShot(0, _patch_excepthook)
@@ -9,7 +9,10 @@ Attribution-NonCommercial-NoDerivs 2.0 UK: England & Wales License.
 
 """
 import os
+import copy
+import queue
 import logging
+import logging.handlers
 import platform
 import subprocess
 import re
@@ -26,29 +29,59 @@ from customxepr.gui.error_dialog import ErrorDialog
 from customxepr import __version__, __url__
 from customxepr.manager import ExpStatus
 from customxepr.config.main import CONF
+from customxepr.startup import BRUKER_XEPR_API_PATH
 
 
 _root = os.path.dirname(os.path.realpath(__file__))
 logger = logging.getLogger(__name__)
 
+# delimiters between email addresses
+_EMAIL_DELIMITERS = re.compile(r"[;, ]+")
+
 
 # ======================================================================================
 # Set up logging handlers for STATUS, INFO and ERROR messages
 # ======================================================================================
 
 
+def _append_rows(model, rows):
+    """
+    Appends all given rows to a :class:`QtGui.QStandardItemModel` with a single
+    insertion instead of one insertion and view update per row.
+
+    :param model: :class:`QtGui.QStandardItemModel` instance.
+    :param list rows: List of rows, each given as a list of items.
+    """
+    if len(rows) == 0:
+        return
+
+    i0 = model.rowCount()
+    model.insertRows(i0, len(rows))
+
+    for i, row in enumerate(rows):
+        for j, item in enumerate(row):
+            model.setItem(i0 + i, j, item)
+
+
 class QInfoLogHandler(logging.Handler, QtCore.QObject):
     """
     Handler which adds all logging event messages to a QStandardItemModel. This model
     will be used to populate the "Message log" in the GUI with all logging messages of
     level INFO and higher.
+
+    Records are buffered and added to the model in batches, at most every
+    :attr:`FLUSH_INTERVAL` msec, with a single desktop notification per batch.
     """
 
+    FLUSH_INTERVAL = 250
+
     notify = DesktopNotifier(
         app_name="CustomXepr",
         app_icon=os.path.join(_root, "resources", "logo@2x.png"),
     )
 
+    _records_added = QtCore.pyqtSignal()
+
     def __init__(self):
         logging.Handler.__init__(self)
         QtCore.QObject.__init__(self)
@@ -57,17 +90,53 @@ class QInfoLogHandler(logging.Handler, QtCore.QObject):
         self.model = QtGui.QStandardItemModel(0, 3)
         self.model.setHorizontalHeaderLabels(["Time", "Level", "Message"])
 
+        # buffer records until the flush timer fires in the GUI thread
+        self._buffer = []
+        self._flush_timer = QtCore.QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(self.FLUSH_INTERVAL)
+        self._flush_timer.timeout.connect(self._flush_buffer)
+        self._records_added.connect(self._flush_timer.start)
+
     def emit(self, record):
         # format logging record
         self.format(record)
-        time_item = QtGui.QStandardItem(record.asctime)
-        level_item = QtGui.QStandardItem(record.levelname)
-        msg_item = QtGui.QStandardItem(record.msg)
+        self._buffer.append(record)
+
+        # the handler lock is held during emit
+        if len(self._buffer) == 1:
+            self._records_added.emit()
+
+    def _flush_buffer(self):
+        with self.lock:
+            records, self._buffer = self._buffer, []
+
+        if len(records) == 0:
+            return
+
+        # add logging records to QStandardItemModel
+        rows = [
+            [
+                QtGui.QStandardItem(record.asctime),
+                QtGui.QStandardItem(record.levelname),
+                QtGui.QStandardItem(record.msg),
+            ]
+            for record in records
+        ]
+        _append_rows(self.model, rows)
 
-        # add logging record to QStandardItemModel
-        self.model.appendRow([time_item, level_item, msg_item])
         # show notification
-        self.notify.send_sync(title="CustomXepr Info", message=record.message)
+        if len(records) == 1:
+            message = records[0].message
+        else:
+            message = "{} new messages. Latest: {}".format(
+                len(records), records[-1].message
+            )
+
+        try:
+            self.notify.send_sync(title="CustomXepr Info", message=message)
+        except Exception:
+            self.handleError(records[-1])
 
 
 class QStatusLogHandler(logging.Handler, QtCore.QObject):
@@ -107,6 +176,21 @@ class QErrorLogHandler(logging.Handler, QtCore.QObject):
             self.error_signal.emit(record.exc_info)
 
 
+class QueueHandlerInProcess(logging.handlers.QueueHandler):
+    """
+    Handler which puts logging records into a queue for processing by a
+    :class:`logging.handlers.QueueListener` in a separate thread. Records are only
+    passed within this process and therefore keep their exception info.
+    """
+
+    def prepare(self, record):
+        # merge args into the message while their values are still current
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
 # create QInfoLogHandler to handle all INFO level events
 fmt_string = "%(asctime)s %(threadName)s %(levelname)s: %(message)s"
 info_fmt = logging.Formatter(fmt=fmt_string, datefmt="%H:%M")
@@ -122,11 +206,16 @@ status_handler.setLevel(logging.DEBUG)
 error_handler = QErrorLogHandler()
 error_handler.setLevel(logging.ERROR)
 
-# add handlers to customxepr logger
+# process records for all Qt handlers in a background thread so that logging calls
+# do not block on model updates or desktop notifications
+log_queue = queue.Queue(-1)
+queue_handler = QueueHandlerInProcess(log_queue)
+queue_listener = logging.handlers.QueueListener(
+    log_queue, status_handler, info_handler, error_handler, respect_handler_level=True
+)
+
+# queue handler is added to the customxepr logger by ManagerApp
 root_logger = logging.getLogger("customxepr")
-root_logger.addHandler(status_handler)
-root_logger.addHandler(info_handler)
-root_logger.addHandler(error_handler)
 
 
 # ======================================================================================
@@ -175,8 +264,8 @@ class ManagerApp(QtWidgets.QMainWindow):
 
         self.helpButton.clicked.connect(lambda: webbrowser.open_new(__url__))
 
-        # create about window and update window
-        self.aboutWindow = AboutWindow()
+        # about window is created on first use
+        self.aboutWindow = None
 
         # load resources
         self.icon_queued = QtGui.QIcon(_root + "/resources/queued@2x.icns")
@@ -238,24 +327,19 @@ class ManagerApp(QtWidgets.QMainWindow):
         self.job_queue.removed_signal.connect(self.on_jobs_removed)
         self.job_queue.status_changed_signal.connect(self.on_job_status_changed)
 
-        # perform various UI updates after status change
-        status_handler.status_signal.connect(self.statusField.setText)
-        status_handler.status_signal.connect(self.check_paused)
-        status_handler.status_signal.connect(self.get_email_list)
-
         # notify user of any errors in job execution with a message box
         error_handler.error_signal.connect(self.show_error)
 
         # connect menu bar callbacks
-        self.action_About.triggered.connect(self.aboutWindow.show)
+        self.action_About.triggered.connect(self.show_about_window)
         self.actionCustomXepr_Help.triggered.connect(
             lambda: webbrowser.open_new(__url__)
         )
         self.actionShow_log_files.triggered.connect(self.on_log_clicked)
         self.action_Exit.triggered.connect(self.exit_)
 
-        if not os.popen("Xepr --apipath").read() == "":
-            url = "file://" + os.popen("Xepr --apipath").read() + "/docs/XeprAPI.html"
+        if BRUKER_XEPR_API_PATH:
+            url = "file://" + BRUKER_XEPR_API_PATH + "/docs/XeprAPI.html"
             self.actionXeprAPI_Help.triggered.connect(lambda: webbrowser.open_new(url))
         else:
             self.actionXeprAPI_Help.setEnabled(False)
@@ -291,8 +375,13 @@ class ManagerApp(QtWidgets.QMainWindow):
         self.timeout_timer.setSingleShot(True)
         self.timeout_timer.timeout.connect(self.timeout_warning)
 
-        # reset timer when there is a status update
-        status_handler.status_signal.connect(self.timeout_timer.start)
+        # perform various UI updates and reset the timeout timer after status change
+        status_handler.status_signal.connect(self.on_status_changed)
+
+        # start forwarding log records to the Qt handlers once all slots are connected
+        if queue_listener._thread is None:
+            queue_listener.start()
+        root_logger.addHandler(queue_handler)
 
         # ==============================================================================
         # Inform user of changes
@@ -325,6 +414,10 @@ class ManagerApp(QtWidgets.QMainWindow):
         self.manager.clear_all_jobs()
         self.manager.abort_job()
         self.save_geometry()
+        # detach the queue handler first, no records must be queued without a listener
+        root_logger.removeHandler(queue_handler)
+        if queue_listener._thread is not None:
+            queue_listener.stop()
         self.deleteLater()
 
     def closeEvent(self, event):
@@ -335,6 +428,11 @@ class ManagerApp(QtWidgets.QMainWindow):
 
         event.accept()
 
+    def show_about_window(self):
+        if not self.aboutWindow:
+            self.aboutWindow = AboutWindow()
+        self.aboutWindow.show()
+
     def show_error(self, exc_info):
         title = "CustomXepr Job Error"
         message = "CustomXepr has encountered an error while executing a job."
@@ -360,7 +458,9 @@ class ManagerApp(QtWidgets.QMainWindow):
         if not indexes:
             return
 
-        i0, i1 = indexes[0].row(), indexes[-1].row()
+        rows = sorted(set(index.row() for index in indexes))
+        i0, i1 = rows[0], rows[-1]
+        result = self.result_queue.queue[i0]
 
         popup_menu = QtWidgets.QMenu()
 
@@ -368,30 +468,26 @@ class ManagerApp(QtWidgets.QMainWindow):
         save_action = popup_menu.addAction("Save...")
         delete_action = popup_menu.addAction("Delete")
 
-        plot_action.setEnabled(False)
-        save_action.setEnabled(False)
-
-        if hasattr(self.result_queue.queue[i0], "plot") and i0 == i1:
-            plot_action.setEnabled(True)
-        if hasattr(self.result_queue.queue[i0], "save") and i0 == i1:
-            save_action.setEnabled(True)
+        plot_action.setEnabled(i0 == i1 and callable(getattr(result, "plot", None)))
+        save_action.setEnabled(i0 == i1 and callable(getattr(result, "save", None)))
 
         action = popup_menu.exec_(QtGui.QCursor.pos())
 
         if action == 0:
             return
         elif action == delete_action:
-            self.result_queue.remove_items(i0, i1)
+            for start, end in self._contiguous_ranges(rows):
+                self.result_queue.remove_items(start, end)
         elif action == save_action:
             prompt = "Save as file"
             filename = "untitled.txt"
             filepath = QtWidgets.QFileDialog.getSaveFileName(None, prompt, filename)
             if len(filepath[0]) < 4:
                 return
-            self.result_queue.queue[i0].save(filepath[0])
+            result.save(filepath[0])
 
         elif action == plot_action:
-            self.result_queue.queue[i0].plot()
+            result.plot()
 
     def open_job_context_menu(self):
         """
@@ -401,18 +497,44 @@ class ManagerApp(QtWidgets.QMainWindow):
         indexes = self.jobQueueDisplay.selectedIndexes()
         if not indexes:
             return
-        i0, i1 = indexes[0].row(), indexes[-1].row()
+        rows = sorted(set(index.row() for index in indexes))
 
         popup_menu = QtWidgets.QMenu()
         delete_action = popup_menu.addAction("Delete")
 
-        if i0 < self.job_queue.first_queued_index():
+        if rows[0] < self.job_queue.first_queued_index():
             delete_action.setEnabled(False)
 
         action = popup_menu.exec_(QtGui.QCursor.pos())
 
         if action == delete_action:
-            self.job_queue.remove_items(i0, i1)
+            for start, end in self._contiguous_ranges(rows):
+                self.job_queue.remove_items(start, end)
+
+    @staticmethod
+    def _contiguous_ranges(rows):
+        """
+        Groups row numbers into ranges of consecutive rows. Ranges are returned last
+        first so that they can be removed one after another without shifting the
+        indices of the remaining ranges.
+
+        :param list rows: Sorted list of unique row numbers.
+        :returns: List of `(start, end)` tuples with inclusive row numbers.
+        :rtype: list
+        """
+        ranges = []
+        start = end = rows[0]
+
+        for row in rows[1:]:
+            if row == end + 1:
+                end = row
+            else:
+                ranges.append((start, end))
+                start = end = row
+
+        ranges.append((start, end))
+
+        return ranges[::-1]
 
     def timeout_warning(self):
         """
@@ -519,6 +641,31 @@ class ManagerApp(QtWidgets.QMainWindow):
         """
 
         exp = self.job_queue.queue[index]
+        self.jobQueueModel.appendRow(self._job_to_row(exp))
+
+    def on_result_added(self, index=-1):
+        """
+        Adds new result to the :attr:`resultQueueModel` and tries to plot the result.
+        The new result is added to the end of :attr:`resultQueueModel`.
+        """
+        result = self.result_queue.queue[index]
+
+        if self.plotCheckBox.isChecked():
+            try:
+                result.plot()
+            except AttributeError:
+                pass
+
+        self.resultQueueModel.appendRow(self._result_to_row(result))
+
+    def _job_to_row(self, exp):
+        """
+        Creates a row of items for :attr:`jobQueueModel` representing an experiment.
+
+        :param exp: :class:`manager.Experiment` instance.
+        :returns: List of :class:`QtGui.QStandardItem` for function and arguments.
+        :rtype: list
+        """
         try:
             sig = inspect.signature(exp.func)
         except (ValueError, TypeError):
@@ -547,15 +694,17 @@ class ManagerApp(QtWidgets.QMainWindow):
 
         func_item.setIcon(self.icon_queued)
 
-        self.jobQueueModel.appendRow([func_item, args_item])
+        return [func_item, args_item]
 
-    def on_result_added(self, index=-1):
-        """
-        Adds new result to the :attr:`resultQueueModel` and tries to plot the result.
-        The new result is added to the end of :attr:`resultQueueModel`.
+    @staticmethod
+    def _result_to_row(result):
         """
-        result = self.result_queue.queue[index]
+        Creates a row of items for :attr:`resultQueueModel` representing a result.
 
+        :param result: Any object returned by an experiment.
+        :returns: List of :class:`QtGui.QStandardItem` for type, size and value.
+        :rtype: list
+        """
         try:
             result_size = result.shape
         except AttributeError:
@@ -564,17 +713,11 @@ class ManagerApp(QtWidgets.QMainWindow):
             except TypeError:
                 result_size = "--"
 
-        if self.plotCheckBox.isChecked():
-            try:
-                result.plot()
-            except AttributeError:
-                pass
-
         rslt_type = QtGui.QStandardItem(type(result).__name__)
         rslt_size = QtGui.QStandardItem(str(result_size))
         rslt_value = QtGui.QStandardItem(str(result).split("\n")[0])
 
-        self.resultQueueModel.appendRow([rslt_type, rslt_size, rslt_value])
+        return [rslt_type, rslt_size, rslt_value]
 
     def on_jobs_removed(self, i0, n_items):
 
@@ -593,16 +736,29 @@ class ManagerApp(QtWidgets.QMainWindow):
         Gets all current items of :attr:`job_queue` and adds them to
         :attr:`jobQueueDisplay`.
         """
-        for i in range(0, self.job_queue.qsize()):
-            self.on_job_added(i)
+        rows = [self._job_to_row(exp) for exp in self.job_queue.queue]
+        _append_rows(self.jobQueueModel, rows)
 
     def populate_results(self):
         """
         Gets all current items of result_queue and adds them to
-        resultQueueDisplay.
+        resultQueueDisplay. Results are not plotted.
+        """
+        with self.result_queue.mutex:
+            results = list(self.result_queue.queue)
+
+        rows = [self._result_to_row(result) for result in results]
+        _append_rows(self.resultQueueModel, rows)
+
+    def on_status_changed(self, status):
+        """
+        Updates the status field, pause button and email list after a status update
+        and resets the timeout timer.
         """
-        for i in range(0, self.result_queue.qsize()):
-            self.on_result_added(i)
+        self.statusField.setText(status)
+        self.check_paused()
+        self.get_email_list()
+        self.timeout_timer.start()
 
     def check_paused(self):
         """
@@ -654,7 +810,7 @@ class ManagerApp(QtWidgets.QMainWindow):
         """
 
         # Split email addresses on delimiters ";", "," and " " and remove emtpy entries.
-        tokens = re.split(r"[;, ]+", self.lineEditEmailList.text())
+        tokens = _EMAIL_DELIMITERS.split(self.lineEditEmailList.text())
         tokens = [token for token in tokens if len(token) > 0]
 
         # clean up displayed text
@@ -668,8 +824,12 @@ class ManagerApp(QtWidgets.QMainWindow):
         Gets the email list from CustomXepr and updates it in the UI.
         """
         address_list = self.manager.notify_address
-        if not self.lineEditEmailList.hasFocus():
-            self.lineEditEmailList.setText(", ".join(address_list))
+        text = ", ".join(address_list)
+        # skip redundant updates, they reset the cursor and undo history
+        if not self.lineEditEmailList.hasFocus() and (
+            self.lineEditEmailList.text() != text
+        ):
+            self.lineEditEmailList.setText(text)
 
     def get_notification_level(self):
         """
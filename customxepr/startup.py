@@ -26,7 +26,7 @@ try:
 except (FileNotFoundError, subprocess.CalledProcessError):
     BRUKER_XEPR_API_PATH = ""
 else:
-    BRUKER_XEPR_API_PATH = res.decode()
+    BRUKER_XEPR_API_PATH = res.decode().strip()
 
 ENVIRON_XEPR_API_PATH = os.environ.get("XEPR_API_PATH", "")
 os.environ["SPY_UMR_ENABLED"] = "False"
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Sam Schott  (ss2151@cam.ac.uk)
+
+(c) Sam Schott; This work is licensed under a Creative Commons
+Attribution-NonCommercial-NoDerivs 2.0 UK: England & Wales License.
+
+"""
+import unittest
+
+import numpy as np
+
+from customxepr.experiment.mode_picture_dataset import ModePicture
+
+FREQ = 9.385
+WIDTH = 5
+NOISE = 2e-5
+
+
+def mode_picture_data(slope, seed=0):
+    """
+    Returns a synthetic mode picture with a narrow dip on a sloped background.
+    """
+    x = np.arange(1000.0)
+    rng = np.random.default_rng(seed)
+
+    background = 1 + slope * (x - 500) + 2e-9 * (x - 500) ** 2
+    dip = 2 / np.pi * WIDTH * 0.5 / (4 * (x - 500) ** 2 + WIDTH ** 2)
+
+    return background - dip + rng.normal(0, NOISE, x.size)
+
+
+class TestModePicture(unittest.TestCase):
+    def test_sloped_background(self):
+        """
+        Test that a weak slope of the background is fitted by the polynomial and does
+        not bias the Q-value.
+        """
+
+        q_value = FREQ / (WIDTH * 1e-3 / 2)
+
+        for slope in (0, 1e-6, 2e-6, 3e-6):
+            mp = ModePicture({1: mode_picture_data(slope)}, FREQ)
+
+            for name, param in mp.fit_result.params.items():
+                self.assertTrue(param.vary, name)
+
+            self.assertAlmostEqual(mp.qvalue / q_value, 1, delta=2e-3)
+            self.assertLess(mp.fit_result.redchi, 2 * NOISE ** 2)
+
+    def test_jacobian(self):
+        """
+        Test the analytic Jacobian passed to lmfit against finite differences of the
+        residual which lmfit actually minimises.
+        """
+
+        fit_result = ModePicture({1: mode_picture_data(1e-6)}, FREQ).fit_result
+
+        def residual(params):
+            return fit_result.userfcn(
+                params, *fit_result.userargs, **fit_result.userkws
+            )
+
+        jacobian = fit_result.kws["Dfun"](
+            fit_result.params, *fit_result.userargs, **fit_result.userkws
+        )
+
+        self.assertEqual(jacobian.shape[0], len(fit_result.var_names))
+
+        for row, name in zip(jacobian, fit_result.var_names):
+            params = fit_result.params.copy()
+            # choose steps which change the residual by about 1e-6
+            step = 1e-6 / np.abs(row).max()
+
+            params[name].set(value=fit_result.params[name].value + step)
+            res_plus = residual(params)
+            params[name].set(value=fit_result.params[name].value - step)
+            res_minus = residual(params)
+
+            finite_diff = (res_plus - res_minus) / (2 * step)
+            np.testing.assert_allclose(
+                row, finite_diff, rtol=1e-4, atol=1e-6 * np.abs(finite_diff).max()
+            )
+
+    def test_cached_fit_results(self):
+        """
+        Test that mode pictures created from identical data share the fit values but
+        not the fit result objects.
+        """
+
+        data = mode_picture_data(1e-6)
+
+        mp1 = ModePicture({1: data}, FREQ)
+        mp2 = ModePicture({1: data}, FREQ)
+
+        self.assertIsNot(mp1.fit_result, mp2.fit_result)
+        self.assertEqual(mp1.fit_result.best_values, mp2.fit_result.best_values)
+
+        mp1.fit_result.params["w"].set(value=1)
+        self.assertNotEqual(mp2.fit_result.params["w"].value, 1)
+
+    def test_poly_degree(self):
+        """
+        Test that invalid degrees of the polynomial background are rejected before
+        fitting.
+        """
+
+        data = {1: mode_picture_data(0)}
+
+        for poly_degree in (-1, 8, 3.0, True):
+            with self.assertRaises(ValueError):
+                ModePicture(data, FREQ, poly_degree=poly_degree)
+
+        for poly_degree in (3, np.int64(3)):
+            mp = ModePicture(data, FREQ, poly_degree=poly_degree)
+            self.assertIn("c3", mp.fit_result.params)
+            self.assertNotIn("c4", mp.fit_result.params)
+
+
+if __name__ == "__main__":
+    unittest.main()